@@ -0,0 +1,352 @@
+# SPEC live monitor
+# 2026-10-19
+# Watch SPEC files during acquisition and reduce the newly completed scans on the fly
+
+import asyncio
+import concurrent.futures
+import json
+import numpy as np
+import os.path
+import spec_reader as sr
+
+
+class CounterRatio:
+  """
+  Reduction callback calculating the ratio of two counters of a scan.
+  Unlike a lambda or a closure, it can be used with a ProcessPoolExecutor.
+  """
+  def __init__(self, numerator, denominator):
+    self.numerator = numerator
+    self.denominator = denominator
+
+  def __call__(self, scan):
+    return getattr(scan, self.numerator)/getattr(scan, self.denominator)
+
+
+def counter_ratio(numerator, denominator):
+  """
+  Returns a reduction callback calculating the ratio of two counters of a scan.
+  Example:
+  >>> mon.register('det/IC1', counter_ratio('det', 'IC1'))
+  """
+  return CounterRatio(numerator, denominator)
+
+
+def expected_points(scan_line):
+  """
+  Returns the number of points expected from the "#S" line of the standard SPEC scans
+  (ascan, dscan, a2scan, d3scan, ... where the intervals are the last but one argument, and mesh),
+  or None if it cannot be guessed.
+  Example:
+  >>> expected_points('#S 12  ascan  th 10 12 20 1')
+  21
+  """
+  args = scan_line.split()[2:]
+  try:
+    if args[0] == 'mesh':
+      return (int(args[4])+1)*(int(args[8])+1)
+    if args[0].endswith('scan') and len(args) >= 6 and (len(args)-3)%3 == 0:
+      return int(args[-2])+1
+  except (IndexError, ValueError):
+    pass
+  return None
+
+
+def _to_json(obj):
+  # numpy arrays and scalars are not JSON serializable as such
+  if isinstance(obj, np.ndarray):
+    return obj.tolist()
+  if isinstance(obj, np.generic):
+    return obj.item()
+  raise TypeError("{} is not JSON serializable".format(type(obj)))
+
+
+class SpecMonitor:
+  """
+  Asynchronous monitor of one or several SPEC files. The files are polled and the appended scans
+  are indexed incrementally (see `SpecFile.update`), without one blocking thread per file.
+  Each newly completed scan is read as a `Scan` and passed to all the registered reduction
+  callbacks, which run concurrently in a worker pool.
+  The last scan of a file is considered completed when it has the number of points expected from
+  its "#S" line (see `expected_points`), or when the next scan starts.
+  SPEC writes the empty line separating the scans just before the next "#S", so it is not waited for.
+  When the number of points cannot be guessed (non-standard scans), the scan is also reduced when the file
+  did not grow for `quiet` s after its last point. Such results are marked as partial, since the scan may
+  go on, and the scan is reduced again when completed.
+  Unless from_start is True, a scan already present in a file at startup is only reduced if it grows afterwards.
+
+  The results are published as dictionaries
+    {'file' : <spec file>, 'scan' : <scan number>, 'callback' : <name>, 'result' : <result>}
+  ('error' instead of 'result' if the reduction failed, and no 'scan' nor 'callback' if the file
+  itself could not be read, 'partial' : True for the partial reductions) to every queue obtained by `subscribe`,
+  and, if a port is given, as JSON lines to every client connected to the local socket.
+
+  Definition:
+  -----------
+  SpecMonitor(spec_files, interval = 1., quiet = 60., port = None, host = '127.0.0.1', executor = None, from_start = False, verbose = False)
+   > spec_files : string or tuple/list of strings
+   > interval : polling period in s
+   > quiet : period without growth of the file after which a non-standard last scan is reduced (never if None)
+   > port, host : local socket on which the results are served (no socket if port is None)
+   > executor : concurrent.futures executor running the reductions (default: a thread pool)
+                The callbacks must be picklable (no lambda, no closure) with a ProcessPoolExecutor.
+   > from_start : True if the scans already present in the files are to be reduced as well
+
+  Attributes:
+  -----------
+  spec_files......list of the watched SPEC file names
+  spec_dict.......dictionary {spec file name : SpecFile instance}
+  callbacks.......dictionary {name : reduction callback}
+
+  Examples:
+  --------
+  In : mon = SpecMonitor(['./lineup0.dat', './lineup1.dat'], port = 5555)
+  In : mon.register('det/IC1', counter_ratio('det', 'IC1'))
+
+  # any function of the Scan, preferably defined in a module (picklable), e.g. in my_reductions.py
+  # def peak(scan):
+  #   return scan.th[scan.det.argmax()]
+  In : import my_reductions
+  In : mon.register('peak', my_reductions.peak)
+
+  # run until interrupted (Ctrl-C), dashboards read the results with e.g.
+  # nc localhost 5555
+  In : mon.start()
+
+  # or from within a running event loop
+  In : q = mon.subscribe()
+  In : task = asyncio.ensure_future(mon.run())
+  In : message = await q.get()
+  """
+
+  def __init__(self, spec_files, interval = 1., quiet = 60., port = None, host = '127.0.0.1', executor = None, from_start = False, verbose = False):
+    if type(spec_files) == str:
+      spec_files = [spec_files,]
+    self.spec_files = list(spec_files)
+    self.spec_dict = {}
+    self.callbacks = {}
+    self.interval = interval
+    self.quiet = quiet
+    self.port = port
+    self.host = host
+    if executor is None:
+      executor = concurrent.futures.ThreadPoolExecutor()
+    self.executor = executor
+    self.from_start = from_start
+    self.verbose = verbose
+    self.__queues__ = [] # subscribers queues
+    self.__running__ = False
+
+
+  def register(self, name, callback):
+    """
+    Register a reduction callback, called with the completed `Scan` as only argument.
+    """
+    self.callbacks[name] = callback
+
+
+  def unregister(self, name):
+    """
+    Remove a reduction callback.
+    """
+    del self.callbacks[name]
+
+
+  def subscribe(self):
+    """
+    Returns a new asyncio.Queue on which all the subsequent results are published.
+    None is published when the monitor stops.
+    """
+    q = asyncio.Queue()
+    self.__queues__.append(q)
+    return q
+
+
+  def unsubscribe(self, q):
+    """
+    Stop publishing the results to the queue q.
+    """
+    self.__queues__.remove(q)
+
+
+  def publish(self, message):
+    for q in self.__queues__:
+      q.put_nowait(message)
+
+
+  async def _reduce(self, scan, name, callback, partial):
+    loop = asyncio.get_running_loop()
+    message = {'file' : scan.file, 'scan' : scan.number, 'callback' : name}
+    if partial:
+      message['partial'] = True
+    try:
+      message['result'] = await loop.run_in_executor(self.executor, callback, scan)
+    except Exception as e:
+      message['error'] = repr(e)
+    self.publish(message)
+
+
+  async def _process(self, spec_file, scan_number, partial = False):
+    loop = asyncio.get_running_loop()
+    if self.verbose : print("processing {}scan {} of {}".format("partial " if partial else "", scan_number, spec_file.file))
+    callbacks = dict(self.callbacks) # callbacks registered while processing are used for the next scans
+    try:
+      # the Scan is read in a thread, as the index it uses is not to be sent to (possibly process) workers
+      scan = await loop.run_in_executor(None, sr.Scan, spec_file, scan_number)
+    except Exception as e:
+      for name in callbacks:
+        message = {'file' : spec_file.file, 'scan' : scan_number, 'callback' : name, 'error' : repr(e)}
+        if partial:
+          message['partial'] = True
+        self.publish(message)
+      return
+    await asyncio.gather(*[self._reduce(scan, name, callbacks[name], partial) for name in callbacks])
+
+
+  async def _open(self, file_name, from_start):
+    # index the file, returns the SpecFile, the scans to be reduced
+    # and whether the last one was already there (stale)
+    loop = asyncio.get_running_loop()
+    # the index is updated in place, hence in a thread and not in the (possibly process) executor
+    spec_file = await loop.run_in_executor(None, sr.SpecFile, file_name)
+    self.spec_dict[file_name] = spec_file
+    new_scans = sorted(spec_file.scan_dict, key=spec_file.scan_dict.get)
+    stale = False
+    if not from_start and len(new_scans) > 0: # only the last scan may still be acquired
+      new_scans = [] if self._completed(spec_file) else new_scans[-1:]
+      stale = len(new_scans) > 0
+    return spec_file, new_scans, stale
+
+
+  def _completed(self, spec_file):
+    # True if the last scan has all its expected points
+    n = expected_points(spec_file.last_scan_line)
+    return n is not None and spec_file.last_scan_points >= n
+
+
+  async def _watch(self, file_name):
+    loop = asyncio.get_running_loop()
+    spec_file = None
+    pending = None # last scan of the file, possibly still being acquired
+    pending_points = 0 # number of points of the pending scan already reduced (partially) or present at startup
+    stale_position = None # end of the file at startup, if the pending scan was already there
+    last_error = None
+    from_start = self.from_start
+    tasks = set()
+    while self.__running__:
+      try:
+        new_scans = []
+        stale = False
+        if spec_file is None:
+          if os.path.isfile(file_name): # wait for the file to be created
+            spec_file, new_scans, stale = await self._open(file_name, from_start)
+            size = os.path.getsize(file_name)
+            last_growth = loop.time()
+          else: # all the scans of a file created after startup are new
+            from_start = True
+        else:
+          new_size = os.path.getsize(file_name)
+          if new_size < spec_file.__last_position__: # the file was truncated or replaced
+            if self.verbose : print("{} shrank, indexing it again".format(file_name))
+            pending = None
+            stale_position = None
+            spec_file, new_scans, stale = await self._open(file_name, True) # all its scans are new
+          elif new_size > spec_file.__last_position__: # only read the file again if something was appended
+            new_scans = await loop.run_in_executor(None, spec_file.update)
+          if new_size != size:
+            size = new_size
+            last_growth = loop.time()
+        last_error = None
+      except Exception as e:
+        # report the error once and keep on polling this file (and the others)
+        if repr(e) != last_error:
+          last_error = repr(e)
+          if self.verbose : print("error while reading {}: {}".format(file_name, last_error))
+          self.publish({'file' : file_name, 'error' : last_error})
+        await asyncio.sleep(self.interval)
+        continue
+
+      for scan_number in new_scans:
+        # the scan already there at startup is skipped if nothing was appended to it before the next one
+        # (the next "#S" line is only preceded by an empty line)
+        if pending is not None and (stale_position is None or spec_file.scan_dict[scan_number] > stale_position + 1):
+          tasks.add(asyncio.ensure_future(self._process(spec_file, pending)))
+        pending = scan_number
+        pending_points = 0
+        stale_position = None
+      if stale:
+        pending_points = spec_file.last_scan_points
+        stale_position = spec_file.__last_position__
+      if pending is not None:
+        n = expected_points(spec_file.last_scan_line)
+        if n is not None and spec_file.last_scan_points >= n:
+          tasks.add(asyncio.ensure_future(self._process(spec_file, pending)))
+          pending = None
+        elif (n is None and self.quiet is not None and spec_file.last_scan_points > pending_points
+              and loop.time() - last_growth > self.quiet):
+          # the scan may go on, it is reduced again when completed
+          tasks.add(asyncio.ensure_future(self._process(spec_file, pending, partial = True)))
+          pending_points = spec_file.last_scan_points
+      tasks = set(t for t in tasks if not t.done())
+      await asyncio.sleep(self.interval)
+    if tasks:
+      await asyncio.wait(tasks)
+
+
+  async def _serve_client(self, reader, writer):
+    q = self.subscribe()
+    try:
+      while True:
+        message = await q.get()
+        if message is None: # the monitor is stopping
+          break
+        try:
+          line = json.dumps(message, default=_to_json)
+        except (TypeError, ValueError) as e: # the result cannot be sent as such
+          message = dict(message)
+          message.pop('result', None)
+          message['error'] = repr(e)
+          line = json.dumps(message)
+        writer.write((line + '\n').encode())
+        await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+      pass
+    finally:
+      self.unsubscribe(q)
+      writer.close()
+
+
+  async def run(self):
+    """
+    Coroutine watching all the files (and serving the results if a port is given) until `stop` is called.
+    """
+    self.__running__ = True
+    server = None
+    if self.port is not None:
+      server = await asyncio.start_server(self._serve_client, self.host, self.port)
+      if self.verbose : print("serving the results on {}:{}".format(self.host, self.port))
+    try:
+      await asyncio.gather(*[self._watch(file_name) for file_name in self.spec_files])
+    finally:
+      self.__running__ = False
+      self.publish(None) # release the subscribers and the connected clients
+      if server is not None:
+        server.close()
+        await server.wait_closed()
+
+
+  def start(self):
+    """
+    Run the monitor in a new event loop, until interrupted.
+    """
+    try:
+      asyncio.run(self.run())
+    except KeyboardInterrupt:
+      pass
+
+
+  def stop(self):
+    """
+    Stop watching the files, the reductions in progress are completed.
+    """
+    self.__running__ = False
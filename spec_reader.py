@@ -28,12 +28,33 @@ class SpecFile:
   date............scan start datestamp
   file............string of the SPEC file name
   scan_dict.......dictionary {scan number : binary position in file}
+  last_scan_closed..True if the last scan has been terminated by an empty line
+  last_scan_line....#S line of the last scan
+  last_scan_points..number of data points read in the last scan
+  motor_names.....list of all motors in the experiment (from #O, or #o when motor names have spaces),
+                  including the motors defined by later file headers
+  motor_table.....array of the start position of every motor (columns) in every scan (rows, in file order)
+  motor_scans.....array of the scan numbers of the rows of motor_table
+  scan_rows.......dictionary {scan number : row in motor_table}
+  motor_index.....dictionary {motor name : column in motor_table}
+
+  Methods:
+  --------
+  update()........index the scans appended to the file since the last reading
+  motor_positions(motor, scan_numbers = None)...start positions of a motor in all (or some) scans
 
   Examples:
   --------
   # read the specfile
   In : sf = SpecFile('./lineup0.dat')
 
+  # index the scans written since then
+  In : sf.update()
+  Out: [266, 267]
+
+  # follow a motor across all the scans, without reading them
+  In : plot(sf.motor_scans, sf.motor_positions('tth'))
+
   """
   # dictionary definitions for handling the spec identifiers
   def __param__(self):
@@ -162,38 +183,156 @@ class SpecFile:
     self.__config__ = "" # list the values of the UB matrix config
     self.comments = ""
     self.scan_dict={}  # dictionary to store the position in the file of the scans
+    self.__last_position__ = 0 # position in the file up to which the scans have been indexed
+    self.last_scan_closed = False # True when the last scan has been terminated by an empty line
+    self.last_scan_line = "" # "#S" line of the last scan
+    self.last_scan_points = 0 # number of data points read in the last scan
+    self.motor_names = []
+    self.motor_index = {} # dictionary {motor name : column in motor_table}
+    self.motor_table = np.empty((0,0)) # start positions of the motors (columns) in each scan (rows)
+    self.motor_scans = np.empty(0, dtype=int) # scan number of each row of motor_table
+    self.scan_rows = {} # dictionary {scan number : row in motor_table}
+    self.__scanpositions__ = [] # motor positions of the last scan, possibly not completely read yet
+    self.__scanmotors__ = [] # motors of the last scan, as defined by the last file header
+    self.__headerlabels__ = "" # motors labels (#O) of the last file header
+    self.__headerlabelsnospace__ = "" # motors labels (#o) of the last file header
+    self.__newheader__ = True # True when motors labels were read since the last scan
+    self.__readingpositions__ = False # True while reading the #P lines of a scan
     try:
-      with open(spec_file,'rU') as f:  # the U mode indicates universal line break, essential for accurate counting
-        # first read the file header (mostly comments and motors definition)
-        # up to the first scan (identified by a line starting with "#S"
-        reading_header = True
-        while reading_header:
-          position_in_file = f.tell() # get the position AHEAD of the scan first line
-          l = f.readline()
-          if len(l) > 1: # not an empty line
-            if l[:2] == '#S':
-              reading_header = False
-              scan_number = int(l.split()[1])
-              if verbose:
-                  print("after reading the header, found scan {} at location {}".format(scan_number,position_in_file))
-              self.scan_dict[scan_number] = position_in_file
-            else:
-              self.__readSpecLine__(l, verbose=verbose)
-        reading_file = True  # change this switch when the end of file is reached (i.e. read an empty string)
+      # read the file header (mostly comments and motors definition) and index all the scans
+      self.update(verbose=verbose)
+    except IOError:
+      print("could not find the file {}".format(spec_file))
+
+
+  def update(self, verbose = False):
+    """
+    Index the scans appended to the file since the last reading, starting from the
+    last indexed position in the file rather than from the beginning.
+    Until the first scan (identified by a line starting with "#S") is found, the lines are read as the file header.
+    A line still being written (not terminated by a line break) is left for the next update.
+    The motor positions (#P lines) of the new scans are added to motor_table in the same pass.
+    Returns the list of the newly indexed scan numbers.
+    """
+    new_scans = []
+    new_positions = [] # motor positions of the new scans
+    last_positions = positions = self.__scanpositions__ # motor positions of the scan being read
+    last_motors = self.__scanmotors__
+    len_last_positions = len(last_positions)
+    with open(self.file,'r') as f:  # universal line break by default, essential for accurate counting
+      f.seek(self.__last_position__)
+      try:
+        reading_file = True  # change this switch when the end of file is reached (i.e. read an incomplete line)
         while reading_file:
           position_in_file = f.tell() # get the position AHEAD of the scan first line
           l = f.readline()
-          if len(l) > 1: # not an empty line
+          if not l.endswith('\n'):
+            reading_file = False
+            self.__last_position__ = position_in_file # the incomplete line is read again next time
+          else:
+            if self.__readingpositions__ and l[:2] != '#P': # all the motor positions of the scan have been read
+              self.__readingpositions__ = False
+              if len(positions) != len(self.__scanmotors__):
+                print("Watch out! There are %i motor positions in scan %i but %i motors in the header !!"%(len(positions),int(self.last_scan_line.split()[1]),len(self.__scanmotors__)))
             if l[:2] == '#S':
               scan_number = int(l.split()[1])
-              if verbose:
+              if len(self.scan_dict) == 0: # end of the header
+                if verbose:
+                  print("after reading the header, found scan {} at location {}".format(scan_number,position_in_file))
+              elif verbose:
                   print("found scan {} at location {}".format(scan_number,position_in_file))
+              if self.__newheader__:
+                self.__motornames__()
               self.scan_dict[scan_number] = position_in_file
-          if l == "":
-            reading_file = False
-    except IOError:
-      print("could not find the file {}".format(spec_file))
-
+              self.last_scan_closed = False
+              self.last_scan_line = l.rstrip()
+              self.last_scan_points = 0
+              new_scans.append(scan_number)
+              positions = []
+              new_positions.append((self.__scanmotors__, positions))
+            elif l[:2] == '#P' and len(self.scan_dict) > 0:
+              positions.extend(self.__motorpositions__(l.split()[1:]))
+              self.__readingpositions__ = True
+            elif l[0] != '#' and len(l) > 1 and len(self.scan_dict) > 0: # data line
+              self.last_scan_points += 1
+            elif len(l) == 1 and len(self.scan_dict) > 0: # empty line after a scan
+              self.last_scan_closed = True
+            elif len(self.scan_dict) == 0 and len(l) > 1: # still in the header
+              self.__readSpecLine__(l, verbose=verbose)
+            if l[:2] in ('#O', '#o'): # motors definition, possibly in a later file header
+              if l.split()[0] == '#O0':
+                self.__headerlabels__ = ""
+                self.__headerlabelsnospace__ = ""
+              if l[1] == 'O':
+                self.__headerlabels__ = self.__headerlabels__ + " ".join(l.split()[1:]) + " "
+              else:
+                self.__headerlabelsnospace__ = self.__headerlabelsnospace__ + " ".join(l.split()[1:]) + " "
+              self.__newheader__ = True
+      except Exception:
+        self.__last_position__ = f.tell() # skip the faulty line, the scans found before are kept
+        raise
+      finally:
+        self.__scanpositions__ = positions
+
+        # update the motor positions table
+        if len(last_positions) != len_last_positions and len(self.motor_scans) > 0: # the last scan was not completely read before
+          self.motor_table[-1] = self.__motorrow__(last_motors, last_positions)
+        if len(new_scans) > 0:
+          for i, scan_number in enumerate(new_scans):
+            self.scan_rows[scan_number] = len(self.motor_scans) + i
+          self.motor_table = np.vstack([self.motor_table] + [self.__motorrow__(motors, p) for motors, p in new_positions])
+          self.motor_scans = np.append(self.motor_scans, new_scans)
+    return new_scans
+
+
+  def __motornames__(self):
+    # motors of the next scans, same convention as Scan.motors
+    motors = self.__headerlabels__.split()
+    if len(self.__headerlabelsnospace__.split()) > 0 and len(self.__headerlabelsnospace__.split()) != len(motors):
+      motors = self.__headerlabelsnospace__.split()
+    self.__scanmotors__ = motors
+    self.__newheader__ = False
+    # the motors not defined before get a new column in the motor positions table
+    for motor in motors:
+      if motor not in self.motor_index:
+        self.motor_index[motor] = len(self.motor_names)
+        self.motor_names.append(motor)
+    if self.motor_table.shape[1] < len(self.motor_names):
+      new_columns = np.full((self.motor_table.shape[0], len(self.motor_names)-self.motor_table.shape[1]), np.nan)
+      self.motor_table = np.hstack([self.motor_table, new_columns])
+
+
+  def __motorpositions__(self, values):
+    # motor positions of a #P line, NaN for the values which are not numbers
+    try:
+      return list(map(float,values))
+    except ValueError:
+      positions = []
+      for value in values:
+        try:
+          positions.append(float(value))
+        except ValueError:
+          positions.append(np.nan)
+      return positions
+
+
+  def __motorrow__(self, motors, positions):
+    # one row of the motor positions table, motors missing in the scan are NaN
+    row = np.full(len(self.motor_names), np.nan)
+    for motor, position in zip(motors, positions):
+      row[self.motor_index[motor]] = position
+    return row
+
+
+  def motor_positions(self, motor, scan_numbers = None):
+    """
+    Returns the start positions of the motor in all the scans (in file order, see motor_scans),
+    or only in the scans given as integer or as tuple/list/array of integer.
+    """
+    column = self.motor_table[:,self.motor_index[motor]]
+    if scan_numbers is None:
+      return column
+    return column[[self.scan_rows[scan_number] for scan_number in np.atleast_1d(scan_numbers)]]
 
 
 class Scan(SpecFile):
@@ -280,7 +419,7 @@ class Scan(SpecFile):
     self.comments = ""
 
 
-    with open(self.file,'rU') as f:
+    with open(self.file,'r') as f:
       # read the first (and possibly only) scan in the list
       # now try to find the scan
       f.seek(spec_file.scan_dict[scan_number])